@@ -8,6 +8,7 @@ from __future__ import division
 
 import sys
 import logging
+import functools
     
 # --- Kodi stuff ---
 import xbmcaddon
@@ -18,35 +19,37 @@ from akl.utils import kodilogging, io, kodi
 from akl.scrapers import ScraperSettings, ScrapeStrategy
 from akl.launchers import ExecutionSettings, get_executor_factory
 
-# Local modules
-from resources.lib.launcher import SteamLauncher
-from resources.lib.scanner import SteamScanner
-from resources.lib.scraper import SteamScraper
-
 kodilogging.config()
 logger = logging.getLogger(__name__)
 
-# --- Addon object (used to access settings) ---
-addon = xbmcaddon.Addon()
-addon_id = addon.getAddonInfo('id')
-addon_version = addon.getAddonInfo('version')
+
+# --- Addon object (used for the addon id and version) ---
+# Created on first use so importing this module does not call into Kodi.
+@functools.lru_cache(maxsize=1)
+def _addon() -> xbmcaddon.Addon:
+    return xbmcaddon.Addon()
+
+
+def _addon_id() -> str:
+    return _addon().getAddonInfo('id')
+
+
+def _addon_version() -> str:
+    return _addon().getAddonInfo('version')
 
 
 # ---------------------------------------------------------------------------------------------
 # This is the plugin entry point.
 # ---------------------------------------------------------------------------------------------
 def run_plugin():
-    os_name = io.is_which_os()
-    
     # --- Some debug stuff for development ---
-    logger.info('------------ Called Advanced Kodi Launcher Plugin: Steam Library ------------')
-    logger.info(f'addon.id         "{addon_id}"')
-    logger.info(f'addon.version    "{addon_version}"')
-    logger.info(f'sys.platform     "{sys.platform}"')
-    logger.info(f'OS               "{os_name}"')
-    
-    for i in range(len(sys.argv)):
-        logger.info('sys.argv[{}] "{}"'.format(i, sys.argv[i]))
+    if logger.isEnabledFor(logging.INFO):
+        logger.info('------------ Called Advanced Kodi Launcher Plugin: Steam Library ------------')
+        logger.info('addon.id         "%s"', _addon_id())
+        logger.info('addon.version    "%s"', _addon_version())
+        logger.info('sys.platform     "%s"', sys.platform)
+        logger.info('OS               "%s"', io.is_which_os())
+        logger.info('sys.argv\n%s', '\n'.join(f'  [{i}] "{arg}"' for i, arg in enumerate(sys.argv)))
     
     addon_args = addons.AklAddonArguments('script.akl.steam')
     try:
@@ -56,16 +59,10 @@ def run_plugin():
         kodi.dialog_OK(text=addon_args.get_usage())
         return
     
-    if addon_args.get_command() == addons.AklAddonArguments.LAUNCH:
-        launch_rom(addon_args)
-    elif addon_args.get_command() == addons.AklAddonArguments.CONFIGURE_LAUNCHER:
-        configure_launcher(addon_args)
-    elif addon_args.get_command() == addons.AklAddonArguments.SCAN:
-        scan_for_roms(addon_args)
-    elif addon_args.get_command() == addons.AklAddonArguments.CONFIGURE_SCANNER:
-        configure_scanner(addon_args)
-    elif addon_args.get_command() == addons.AklAddonArguments.SCRAPE:
-        run_scraper(addon_args)
+    command_name = addon_args.get_command()
+    command = _COMMANDS.get(sys.intern(command_name)) if command_name else None
+    if command is not None:
+        command(addon_args)
     elif addon_args.args.cmd == "update-settings":
         update_plugin_settings()
     else:
@@ -79,6 +76,7 @@ def run_plugin():
 # ---------------------------------------------------------------------------------------------
 # Arguments: --akl_addon_id --entity_id --entity_type
 def launch_rom(args: addons.AklAddonArguments):
+    from resources.lib.launcher import SteamLauncher
     logger.debug('Steam Library Launcher: Starting ...')
     
     try:
@@ -91,8 +89,7 @@ def launch_rom(args: addons.AklAddonArguments):
         execution_settings.suspend_screensaver = settings.getSettingAsBool('suspend_screensaver')
         execution_settings.suspend_joystick_engine = settings.getSettingAsBool('suspend_joystick')
                 
-        addon_dir = kodi.getAddonDir()
-        report_path = addon_dir.pjoin('reports')
+        report_path = kodi.getAddonDir().pjoin('reports')
         if not report_path.exists():
             report_path.makedirs()
         report_path = report_path.pjoin(f'{args.get_akl_addon_id()}-{args.get_entity_id()}.txt')
@@ -114,6 +111,7 @@ def launch_rom(args: addons.AklAddonArguments):
 
 # Arguments: --akl_addon_id --entity_id --entity_type
 def configure_launcher(args: addons.AklAddonArguments):
+    from resources.lib.launcher import SteamLauncher
     logger.debug('Steam Library Launcher: Configuring ...')
         
     launcher = SteamLauncher(
@@ -134,11 +132,11 @@ def configure_launcher(args: addons.AklAddonArguments):
 # ---------------------------------------------------------------------------------------------
 # Arguments: --akl_addon_id --romcollection_id --server_host --server_port
 def scan_for_roms(args: addons.AklAddonArguments):
+    from resources.lib.scanner import SteamScanner
     logger.debug('Steam Library scanner: Starting scan ...')
     progress_dialog = kodi.ProgressDialog()
 
-    addon_dir = kodi.getAddonDir()
-    report_path = addon_dir.pjoin('reports')
+    report_path = kodi.getAddonDir().pjoin('reports')
             
     scanner = SteamScanner(
         report_path,
@@ -154,14 +152,14 @@ def scan_for_roms(args: addons.AklAddonArguments):
     
     amount_dead = scanner.amount_of_dead_roms()
     if amount_dead > 0:
-        logger.info('scan_for_roms(): {} roms marked as dead'.format(amount_dead))
+        logger.info('scan_for_roms(): %d roms marked as dead', amount_dead)
         scanner.remove_dead_roms()
         
     amount_scanned = scanner.amount_of_scanned_roms()
     if amount_scanned == 0:
         logger.info('scan_for_roms(): No roms scanned')
     else:
-        logger.info('scan_for_roms(): {} roms scanned'.format(amount_scanned))
+        logger.info('scan_for_roms(): %d roms scanned', amount_scanned)
         scanner.store_scanned_roms()
         
     kodi.notify('ROMs scanning done')
@@ -169,9 +167,9 @@ def scan_for_roms(args: addons.AklAddonArguments):
 
 # Arguments: --akl_addon_id (opt) --romcollection_id
 def configure_scanner(args: addons.AklAddonArguments):
+    from resources.lib.scanner import SteamScanner
     logger.debug('Steam Library scanner: Configuring ...')
-    addon_dir = kodi.getAddonDir()
-    report_path = addon_dir.pjoin('reports')
+    report_path = kodi.getAddonDir().pjoin('reports')
     
     scanner = SteamScanner(
         report_path,
@@ -191,6 +189,7 @@ def configure_scanner(args: addons.AklAddonArguments):
 # Scraper methods.
 # ---------------------------------------------------------------------------------------------
 def run_scraper(args: addons.AklAddonArguments):
+    from resources.lib.scraper import SteamScraper
     logger.debug('========== run_scraper() BEGIN ==================================================')
     pdialog = kodi.ProgressDialog()
     
@@ -204,14 +203,12 @@ def run_scraper(args: addons.AklAddonArguments):
                 
     if args.get_entity_type() == constants.OBJ_ROM:
         scraped_rom = scraper_strategy.process_single_rom(args.get_entity_id())
-        pdialog.endProgress()
-        pdialog.startProgress('Saving ROM in database ...')
+        pdialog.updateMessage('Saving ROM in database ...')
         scraper_strategy.store_scraped_rom(args.get_akl_addon_id(), args.get_entity_id(), scraped_rom)
         pdialog.endProgress()
     else:
         scraped_roms = scraper_strategy.process_roms(args.get_entity_type(), args.get_entity_id())
-        pdialog.endProgress()
-        pdialog.startProgress('Saving ROMs in database ...')
+        pdialog.updateMessage('Saving ROMs in database ...')
         scraper_strategy.store_scraped_roms(args.get_akl_addon_id(),
                                             args.get_entity_type(),
                                             args.get_entity_id(),
@@ -223,19 +220,28 @@ def run_scraper(args: addons.AklAddonArguments):
 # UPDATE PLUGIN
 # ---------------------------------------------------------------------------------------------
 def update_plugin_settings():
-    supported_assets = '|'.join(SteamScraper.supported_asset_list)
-    supported_metadata = '|'.join(SteamScraper.supported_metadata_list)
+    from resources.lib.scraper import SUPPORTED_ASSETS_JOINED, SUPPORTED_METADATA_JOINED
     
-    settings.setSetting("akl.scraper.supported_assets", supported_assets)
-    settings.setSetting("akl.scraper.supported_metadata", supported_metadata)
+    settings.setSetting("akl.scraper.supported_assets", SUPPORTED_ASSETS_JOINED)
+    settings.setSetting("akl.scraper.supported_metadata", SUPPORTED_METADATA_JOINED)
     kodi.notify("Updated AKL plugin settings for this addon")
 
 
 # ---------------------------------------------------------------------------------------------
 # RUN
 # ---------------------------------------------------------------------------------------------
-try:
-    run_plugin()
-except Exception as ex:
-    logger.fatal('Exception in plugin', exc_info=ex)
-    kodi.notify_error("General failure")
+# Keys are interned so the lookup with the interned command name is an identity match.
+_COMMANDS = {sys.intern(name): command for name, command in (
+    (addons.AklAddonArguments.LAUNCH, launch_rom),
+    (addons.AklAddonArguments.CONFIGURE_LAUNCHER, configure_launcher),
+    (addons.AklAddonArguments.SCAN, scan_for_roms),
+    (addons.AklAddonArguments.CONFIGURE_SCANNER, configure_scanner),
+    (addons.AklAddonArguments.SCRAPE, run_scraper)
+)}
+
+if __name__ == '__main__':
+    try:
+        run_plugin()
+    except Exception as ex:
+        logger.fatal('Exception in plugin', exc_info=ex)
+        kodi.notify_error("General failure")
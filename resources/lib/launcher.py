@@ -17,6 +17,7 @@ from __future__ import unicode_literals
 from __future__ import division
 
 import logging
+import functools
 
 # --- AKL packages ---
 from akl.utils import kodi
@@ -25,6 +26,12 @@ from akl.launchers import LauncherABC, ExecutorFactoryABC, ExecutionSettings
 logger = logging.getLogger(__name__)
 
 
+# The addon id never changes while the interpreter is alive, so look it up once.
+@functools.lru_cache(maxsize=1)
+def _get_addon_id() -> str:
+    return kodi.get_addon_id()
+
+
 # -------------------------------------------------------------------------------------------------
 # Launcher to use with a local Steam application and account.
 # -------------------------------------------------------------------------------------------------
@@ -38,6 +45,7 @@ class SteamLauncher(LauncherABC):
                  executorFactory: ExecutorFactoryABC = None,
                  execution_settings: ExecutionSettings = None):
         self.logger = logging.getLogger(__name__)
+        self.arguments_prepared = False
         super(SteamLauncher, self).__init__(launcher_id, rom_id, webservice_host, webservice_port,
                                             executorFactory, execution_settings)
         
@@ -48,8 +56,7 @@ class SteamLauncher(LauncherABC):
         return 'Steam Launcher'
      
     def get_launcher_addon_id(self) -> str:
-        addon_id = kodi.get_addon_id()
-        return addon_id
+        return _get_addon_id()
 
     # --------------------------------------------------------------------------------------------
     # Launcher build wizard methods
@@ -78,8 +85,10 @@ class SteamLauncher(LauncherABC):
         return 'steam://rungameid/'
         
     def get_arguments(self) -> str:
-        arguments = '$steamid$'
-        original_arguments = self.launcher_settings['args'] if 'args' in self.launcher_settings else ''
-        self.launcher_settings['args'] = '{} {}'.format(arguments, original_arguments)
+        # Prefix the steam id only once, repeated calls would keep prepending it.
+        if not self.arguments_prepared:
+            original_arguments = self.launcher_settings['args'] if 'args' in self.launcher_settings else ''
+            self.launcher_settings['args'] = f'$steamid$ {original_arguments}'
+            self.arguments_prepared = True
         return super(SteamLauncher, self).get_arguments()
     
@@ -18,9 +18,13 @@ from __future__ import unicode_literals
 from __future__ import division
 
 import logging
+import functools
 import typing
 import collections
 import json
+import time
+
+from operator import attrgetter
 
 # --- AKL packages ---
 from akl import report, settings, api
@@ -30,10 +34,24 @@ from akl.utils.net import ContentType
 from akl.scanners import RomScannerStrategy, ROMCandidateABC
 
 
+# --- Cached addon info (constant for the lifetime of the plugin) ---
+@functools.lru_cache(maxsize=1)
+def _get_addon_id() -> str:
+    return kodi.get_addon_id()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_addon_version() -> str:
+    return kodi.get_addon_version()
+
+
 class SteamCandidate(ROMCandidateABC):
     
     def __init__(self, json_data):
         self.json_data = json_data
+        self.app_id = json_data['appid']
+        self.name = json_data['name']
+        self.sort_value = self.name
         super(SteamCandidate, self).__init__()
         
     def get_ROM(self) -> api.ROMObj:
@@ -44,24 +62,26 @@ class SteamCandidate(ROMCandidateABC):
             'steamid': self.get_app_id(),
             'steam_name': self.get_name(),
             'steam_data': json.dumps(self.json_data),
-            'scanner': kodi.get_addon_id(),
-            'scanner_version': kodi.get_addon_version()
+            'scanner': _get_addon_id(),
+            'scanner_version': _get_addon_version()
         }
         rom.set_scanned_data(scanned_data)
         return rom
         
     def get_sort_value(self):
-        return self.json_data['name']
+        return self.sort_value
     
     def get_app_id(self):
-        return self.json_data['appid']
+        return self.app_id
     
     def get_name(self):
-        return self.json_data['name']
+        return self.name
 
 
 class SteamScanner(RomScannerStrategy):
 
+    URL_OwnedGames = 'https://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/?key={}&steamid={}&include_appinfo=1&format=json'
+
     def __init__(self,
                  reports_dir: io.FileName,
                  source_id: str,
@@ -69,6 +89,7 @@ class SteamScanner(RomScannerStrategy):
                  webservice_port: int,
                  progress_dialog: kodi.ProgressDialog):
         self.logger = logging.getLogger(__name__)
+        self.cache_dir = reports_dir
         super(SteamScanner, self).__init__(reports_dir, source_id,
                                            webservice_host, webservice_port,
                                            progress_dialog)
@@ -80,8 +101,7 @@ class SteamScanner(RomScannerStrategy):
         return 'Steam Library scanner'
     
     def get_scanner_addon_id(self) -> str:
-        addon_id = kodi.get_addon_id()
-        return addon_id
+        return _get_addon_id()
     
     def get_steam_id(self) -> str:
         return self.scanner_settings['steamid'] if 'steamid' in self.scanner_settings else None
@@ -111,28 +131,69 @@ class SteamScanner(RomScannerStrategy):
     # ~~~ Scan for new files (*.*) and put them in a list ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     def _getCandidates(self, launcher_report: report.Reporter) -> typing.List[ROMCandidateABC]:
         self.progress_dialog.startProgress('Reading Steam account...')
-        launcher_report.write('Reading Steam account id {}'.format(self.get_steam_id()))
-     
-        apikey = settings.getSetting('steam-api-key')
+        try:
+            return self._read_steam_library(launcher_report)
+        finally:
+            self.progress_dialog.endProgress()
+
+    def _read_steam_library(self, launcher_report: report.Reporter) -> typing.List[ROMCandidateABC]:
         steamid = self.get_steam_id()
-        url = 'http://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/?key={}&steamid={}&include_appinfo=1'.format(apikey, steamid)
-        
-        self.progress_dialog.updateProgress(70)
-        json_body, http_code = net.get_URL(url, content_type=ContentType.JSON)
-        self.progress_dialog.updateProgress(80)
-        
-        if http_code != 200:
-            self.logger.warning("Failure while retrieving json web data")
-            kodi.notify_warn("Failure retrieving web data")
-            return []
+        launcher_report.write('Reading Steam account id {}'.format(steamid))
+     
+        json_body = self._load_owned_games_from_cache(steamid)
+        if json_body is None:
+            apikey = settings.getSetting('steam-api-key')
+            url = SteamScanner.URL_OwnedGames.format(apikey, steamid)
+            json_body, http_code = net.get_URL(url, content_type=ContentType.JSON)
+            
+            if http_code != 200:
+                self.logger.warning("Failure while retrieving json web data")
+                kodi.notify_warn("Failure retrieving web data")
+                return []
+            self._store_owned_games_in_cache(steamid, json_body)
+        else:
+            launcher_report.write('  Using cached Steam library')
 
         games = json_body['response']['games']
         num_games = len(games)
         launcher_report.write(f'  Library scanner found {num_games} games')
-        
-        self.progress_dialog.endProgress()
-        return [*(SteamCandidate(g) for g in games)]
+        return list(map(SteamCandidate, games))
     
+    # --- Owned games cache --------------------------------------------------------------------
+    # The GetOwnedGames response is kept next to the scanner reports for 'steam-cache-ttl'
+    # minutes, so repeated scans do not hit the Steam API every time. A TTL of 0 disables it.
+    def _get_owned_games_cache_file(self, steamid: str) -> io.FileName:
+        return self.cache_dir.pjoin(f'steam_owned_{steamid}.json')
+
+    def _load_owned_games_from_cache(self, steamid: str) -> typing.Optional[dict]:
+        cache_ttl = settings.getSettingAsInt('steam-cache-ttl')
+        if not cache_ttl:
+            return None
+
+        cache_file = self._get_owned_games_cache_file(steamid)
+        if not cache_file.exists():
+            return None
+
+        try:
+            cached_data = json.loads(cache_file.loadFileToStr())
+            if time.time() - cached_data['timestamp'] > cache_ttl * 60:
+                self.logger.debug('Steam library cache expired')
+                return None
+            self.logger.debug('Steam library cache hit')
+            return cached_data['response']
+        except Exception as ex:
+            self.logger.warning('Failed to read Steam library cache', exc_info=ex)
+            return None
+
+    def _store_owned_games_in_cache(self, steamid: str, json_body: dict):
+        if not settings.getSettingAsInt('steam-cache-ttl'):
+            return
+        cache_file = self._get_owned_games_cache_file(steamid)
+        try:
+            cache_file.saveStrToFile(json.dumps({'timestamp': time.time(), 'response': json_body}))
+        except Exception as ex:
+            self.logger.warning('Failed to write Steam library cache', exc_info=ex)
+
     # --- Get dead entries -----------------------------------------------------------------
     def _getDeadRoms(self, candidates: typing.List[ROMCandidateABC], roms: typing.List[api.ROMObj]) -> typing.List[api.ROMObj]:
         dead_roms = []
@@ -142,22 +203,30 @@ class SteamScanner(RomScannerStrategy):
             return dead_roms
         
         self.logger.info('Starting dead items scan')
-        i = 0
             
         self.progress_dialog.startProgress('Checking for dead ROMs ...', num_roms)
         
         candidate_steam_ids = set(c.get_app_id() for c in candidates)
-        for rom in reversed(roms):
+        num_alive = 0
+        # Repaint the dialog about a hundred times in total instead of once per ROM.
+        update_every = max(1, num_roms // 100)
+        for i, rom in enumerate(roms):
             steam_id = rom.get_scanned_data_element('steamid')
-            self.logger.info('Searching ID#{}'.format(steam_id))
-            self.progress_dialog.updateProgress(i)
-            
-            if steam_id not in candidate_steam_ids:
-                self.logger.info('Not found. Marking as dead: #{} {}'.format(steam_id, rom.get_name()))
-                roms.remove(rom)
-                dead_roms.append(rom)
-            i += 1
+            self.logger.info('Searching ID#%s', steam_id)
+            if i % update_every == 0:
+                self.progress_dialog.updateProgress(i)
             
+            if steam_id in candidate_steam_ids:
+                # Compact the surviving ROMs to the front of the list in place.
+                roms[num_alive] = rom
+                num_alive += 1
+                continue
+
+            self.logger.info('Not found. Marking as dead: #%s %s', steam_id, rom.get_name())
+            dead_roms.append(rom)
+        
+        # Callers expect the dead ROMs to be removed from the given list.
+        del roms[num_alive:]
         self.progress_dialog.endProgress()
         return dead_roms
 
@@ -167,41 +236,51 @@ class SteamScanner(RomScannerStrategy):
                            roms: typing.List[api.ROMObj],
                            launcher_report: report.Reporter) -> typing.List[api.ROMObj]:
 
-        num_items = len(candidates)
+        steamIdsAlreadyInSource = set(rom.get_scanned_data_element('steamid') for rom in roms)
+
+        # Only games not yet in the source need processing, so leave out the rest before sorting.
+        new_candidates = [c for c in candidates if c.get_app_id() not in steamIdsAlreadyInSource]
+        num_items = len(new_candidates)
         new_roms: typing.List[api.ROMObj] = []
 
         self.progress_dialog.startProgress('Scanning found items', num_items)
         self.logger.debug('============================== Processing Steam Games ==============================')
+        self.logger.debug('%d games already in source. Skipping', len(candidates) - num_items)
         launcher_report.write('Processing games ...')
         num_items_checked = 0
-        
-        steamIdsAlreadyInSource = set(rom.get_scanned_data_element('steamid') for rom in roms)
+        update_every = max(1, num_items // 100)
 
-        for candidate in sorted(candidates, key=lambda c: c.get_sort_value()):
+        # Bind the per-item calls once, they are looked up on every game otherwise.
+        update_progress = self.progress_dialog.updateProgress
+        is_canceled = self.progress_dialog.isCanceled
+        write_report = launcher_report.write
+        debug = self.logger.debug
+        is_debug = self.logger.isEnabledFor(logging.DEBUG)
+
+        for candidate in sorted(new_candidates, key=attrgetter('sort_value')):
             
             steam_candidate: SteamCandidate = candidate
-            steamId = steam_candidate.get_app_id()
-            
-            self.logger.debug('Searching {} with #{}'.format(steam_candidate.get_name(), steamId))
-            self.progress_dialog.updateProgress(num_items_checked, steam_candidate.get_name())
+            steamId = steam_candidate.app_id
+            name = steam_candidate.name
             
-            if steamId in steamIdsAlreadyInSource:
-                self.logger.debug('  ID#{} already in source. Skipping'.format(steamId))
-                num_items_checked += 1
-                continue
+            if is_debug:
+                debug('Searching %s with #%s', name, steamId)
+            is_update_step = num_items_checked % update_every == 0
+            if is_update_step:
+                update_progress(num_items_checked, name)
             
-            self.logger.debug('========== Processing Steam game ==========')
-            launcher_report.write('>>> title: {}'.format(steam_candidate.get_name()))
-            launcher_report.write('>>> ID: {}'.format(steam_candidate.get_app_id()))
-        
-            self.logger.debug(f'Not found. Item {steam_candidate.get_name()} is new')
+            if is_debug:
+                debug('========== Processing Steam game ==========')
+                debug('Not found. Item %s is new', name)
+            write_report(f'>>> title: {name}')
+            write_report(f'>>> ID: {steamId}')
 
             # ~~~~~ Process new ROM and add to the list ~~~~~
             new_rom = steam_candidate.get_ROM()
             new_roms.append(new_rom)
             
             # ~~~ Check if user pressed the cancel button ~~~
-            if self.progress_dialog.isCanceled():
+            if is_update_step and is_canceled():
                 self.progress_dialog.endProgress()
                 kodi.dialog_OK('Stopping ROM scanning. No changes have been made.')
                 self.logger.info('User pressed Cancel button when scanning ROMs. ROM scanning stopped.')
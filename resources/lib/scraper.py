@@ -20,7 +20,10 @@ from __future__ import division
 import logging
 import json
 import re
+import time
+import collections
 
+from operator import itemgetter
 from urllib.parse import quote_plus
 
 # --- AKL packages ---
@@ -29,6 +32,12 @@ from akl.utils import io, net, kodi
 from akl.scrapers import Scraper
 from akl.api import ROMObj
 
+# --- Precompiled patterns ---
+_RE_APIKEY_MID = re.compile('apikey=[^&]*&')
+_RE_APIKEY_END = re.compile('apikey=[^&]*$')
+_RE_HTML_TAG = re.compile('<[^<]+?>')
+_RE_YEAR = re.compile(r'\d{4}')
+
 
 # ------------------------------------------------------------------------------------------------
 # SteamScraper online scraper (metadata and assets).
@@ -55,18 +64,42 @@ class SteamScraper(Scraper):
     URL_SearchAppByName = 'https://steamcommunity.com/actions/SearchApps/{}'
     URL_GameDetails = 'https://store.steampowered.com/api/appdetails?appids={}&cc=EE&l=english&v=1'
 
+    CANDIDATES_CACHE_SIZE = 512
+    # At most API_CALLS_PER_WINDOW requests are sent within API_WINDOW_SECONDS.
+    API_CALLS_PER_WINDOW = 5
+    API_WINDOW_SECONDS = 2.0
+
+    # Appdetails fields read by get_assets(), stored next to the parsed gamedata in the disk cache.
+    ASSET_SLICE_FIELDS = ['header_image', 'background_raw', 'movies', 'screenshots']
+    # Increase when the layout of the metadata disk cache entries changes.
+    METADATA_CACHE_VERSION = 2
+
+    # Steam store category IDs mapped to AKL tags, in the order the tags are added.
+    CATEGORY_TAGS = [
+        ('multiplayer', frozenset([1])),
+        ('singleplayer', frozenset([2])),
+        ('co-op', frozenset([9])),
+        ('online-co-op', frozenset([38])),
+        ('pvp', frozenset([49])),
+        ('online-pvp', frozenset([36])),
+        ('splitscreen', frozenset([24, 37, 39])),
+        ('partial-controller-support', frozenset([18])),
+        ('controller-supported', frozenset([28]))
+    ]
+
     # --- Constructor ----------------------------------------------------------------------------
     def __init__(self):
         self.logger = logging.getLogger(__name__)
             
         # --- Cached data ---
-        self.cache_candidates = {}
+        self.cache_candidates = collections.OrderedDict()
         self.cache_metadata = {}
         self.cache_assets = {}
         self.all_asset_cache = {}
 
         cache_dir = settings.getSettingAsFilePath('scraper_cache_dir')
-        self.call_count = 0
+        # Send times of the most recent requests, oldest first.
+        self.api_call_times = collections.deque(maxlen=SteamScraper.API_CALLS_PER_WINDOW)
                 
         super(SteamScraper, self).__init__(cache_dir)
     
@@ -137,36 +170,14 @@ class SteamScraper(Scraper):
             self.logger.debug('Scraper disabled. Returning empty data.')
             return self._new_gamedata_dic()
 
-        # --- Check if search term is in the cache ---
-        if self._check_disk_cache(Scraper.CACHE_METADATA, self.cache_key):
-            self.logger.debug(f'Metadata cache hit "{self.cache_key}"')
-            json_data = self._retrieve_from_disk_cache(Scraper.CACHE_METADATA, self.cache_key)
-        else:
-            # --- Request is not cached. Get online data and introduce in the cache ---
-            self.logger.debug(f'Metadata cache miss "{self.cache_key}"')
-            id = self.candidate['id']
-            url = SteamScraper.URL_GameDetails.format(id)
-            json_data = self._retrieve_URL_as_JSON(url, status_dic)
-            if not status_dic['status']:
-                return None
-            self._dump_json_debug('Steam_get_metadata.json', json_data)
-            # --- Put metadata in the cache ---
-            self.logger.debug(f'Adding to metadata cache "{self.cache_key}"')
-            self._update_disk_cache(Scraper.CACHE_METADATA, self.cache_key, json_data)
-
-        # --- Parse game page data ---
-        self.logger.debug('Parsing game metadata...')
-        online_data = json_data[id]['data']
-        gamedata = self._new_gamedata_dic()
-        gamedata['title'] = self._parse_metadata_title(online_data)
-        gamedata['year'] = self._parse_metadata_year(online_data)
-        gamedata['genre'] = self._parse_metadata_genres(online_data)
-        gamedata['developer'] = self._parse_metadata_developer(online_data)
-        gamedata['plot'] = self._parse_metadata_plot(online_data)
-        gamedata['rating'] = self._parse_metadata_rating(online_data)
-        gamedata['tags'] = self._parse_metadata_tags(online_data)
+        # --- Get game page data ---
+        scraped_data = self._get_online_data(self.candidate['id'], status_dic)
+        if scraped_data is None:
+            return None
 
-        self.logger.debug(f"Available metadata for the current scraped title: {json.dumps(gamedata)}")
+        gamedata = dict(scraped_data['gamedata'])
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Available metadata for the current scraped title: {json.dumps(gamedata)}")
         return gamedata
  
     # This function may be called many times in the ROM Scanner. All calls to this function
@@ -180,23 +191,11 @@ class SteamScraper(Scraper):
         candidate_id = self.candidate['id']
         self.logger.debug(f'Getting assets {asset_info_id} for candidate ID "{candidate_id}"')
 
-        # --- Check if search term is in the cache ---
-        if self._check_disk_cache(Scraper.CACHE_METADATA, self.cache_key):
-            self.logger.debug(f'Metadata cache hit "{self.cache_key}"')
-            json_data = self._retrieve_from_disk_cache(Scraper.CACHE_METADATA, self.cache_key)
-        else:
-            # --- Request is not cached. Get online data and introduce in the cache ---
-            self.logger.debug(f'Metadata cache miss "{self.cache_key}"')
-            url = SteamScraper.URL_GameDetails.format(candidate_id)
-            json_data = self._retrieve_URL_as_JSON(url, status_dic)
-            if not status_dic['status']:
-                return None
-            self._dump_json_debug('Steam_get_metadata.json', json_data)
-            # --- Put metadata in the cache ---
-            self.logger.debug(f'Adding to metadata cache "{self.cache_key}"')
-            self._update_disk_cache(Scraper.CACHE_METADATA, self.cache_key, json_data)
+        scraped_data = self._get_online_data(candidate_id, status_dic)
+        if scraped_data is None:
+            return None
 
-        online_data = json_data[candidate_id]['data']
+        online_data = scraped_data['asset_slice']
         assets_list = []
         if asset_info_id == constants.ASSET_TRAILER_ID:
             if 'movies' not in online_data:
@@ -255,6 +254,60 @@ class SteamScraper(Scraper):
         self.logger.debug(f"Total assets found {len(assets_list)} for type {asset_info_id}")
         return assets_list
 
+    # Returns the scraped data of a game, either from the disk cache or online.
+    # The disk cache holds the parsed gamedata and the appdetails fields used by
+    # get_assets() ('asset_slice'), not the full appdetails response. The last game
+    # is kept in memory, so get_metadata() and the get_assets() call for every asset
+    # kind of the same ROM share one lookup.
+    def _get_online_data(self, candidate_id, status_dic):
+        if candidate_id in self.cache_metadata:
+            return self.cache_metadata[candidate_id]
+
+        # --- Check if search term is in the cache ---
+        cache_key = self._get_metadata_cache_key()
+        if self._check_disk_cache(Scraper.CACHE_METADATA, cache_key):
+            self.logger.debug(f'Metadata cache hit "{cache_key}"')
+            scraped_data = self._retrieve_from_disk_cache(Scraper.CACHE_METADATA, cache_key)
+        else:
+            # --- Request is not cached. Get online data and introduce in the cache ---
+            self.logger.debug(f'Metadata cache miss "{cache_key}"')
+            url = SteamScraper.URL_GameDetails.format(candidate_id)
+            json_data = self._retrieve_URL_as_JSON(url, status_dic)
+            if not status_dic['status']:
+                return None
+            self._dump_json_debug('Steam_get_metadata.json', json_data)
+
+            online_data = json_data[candidate_id]['data']
+            scraped_data = {
+                'gamedata': self._parse_gamedata(online_data),
+                'asset_slice': {field: online_data[field] for field in SteamScraper.ASSET_SLICE_FIELDS
+                                if field in online_data}
+            }
+            # --- Put metadata in the cache ---
+            self.logger.debug(f'Adding to metadata cache "{cache_key}"')
+            self._update_disk_cache(Scraper.CACHE_METADATA, cache_key, scraped_data)
+
+        self.cache_metadata.clear()
+        self.cache_metadata[candidate_id] = scraped_data
+        return scraped_data
+
+    # The cache format version is part of the key, so entries written in an older
+    # layout (e.g. the raw appdetails response) are never read back.
+    def _get_metadata_cache_key(self):
+        return f'{self.cache_key}_v{SteamScraper.METADATA_CACHE_VERSION}'
+
+    def _parse_gamedata(self, online_data):
+        self.logger.debug('Parsing game metadata...')
+        gamedata = self._new_gamedata_dic()
+        gamedata['title'] = self._parse_metadata_title(online_data)
+        gamedata['year'] = self._parse_metadata_year(online_data)
+        gamedata['genre'] = self._parse_metadata_genres(online_data)
+        gamedata['developer'] = self._parse_metadata_developer(online_data)
+        gamedata['plot'] = self._parse_metadata_plot(online_data)
+        gamedata['rating'] = self._parse_metadata_rating(online_data)
+        gamedata['tags'] = self._parse_metadata_tags(online_data)
+        return gamedata
+
     def resolve_asset_URL(self, selected_asset, status_dic):
         url = selected_asset['url']
         url_log = self._clean_URL_for_log(url)
@@ -274,6 +327,15 @@ class SteamScraper(Scraper):
 
     # --- Retrieve list of games ---
     def _search_candidates(self, search_term: str, status_dic):
+        # Normalized once, so the cache key, the request and the scoring all use the same term.
+        search_term = search_term.strip()
+        search_term_lower = search_term.lower()
+        cache_key = search_term_lower
+        if cache_key in self.cache_candidates:
+            self.logger.debug(f'Candidates cache hit "{cache_key}"')
+            self.cache_candidates.move_to_end(cache_key)
+            return self.cache_candidates[cache_key]
+
         search_string_encoded = quote_plus(search_term)
         url = SteamScraper.URL_SearchAppByName.format(search_string_encoded)
 
@@ -289,24 +351,30 @@ class SteamScraper(Scraper):
 
         # --- Parse game list ---
         candidate_list = []
+        new_candidate = self._new_candidate_dic
+        add_candidate = candidate_list.append
         for item in json_data:
             title = item['name']
+            title_lower = title.lower()
 
-            candidate = self._new_candidate_dic()
+            candidate = new_candidate()
             candidate['id'] = item['appid']
             candidate['display_name'] = title
             candidate['order'] = 1
             # Increase search score based on our own search.
-            if title.lower() == search_term.lower():
+            if title_lower == search_term_lower:
                 candidate['order'] += 2
-            if title.lower().find(search_term.lower()) != -1:
+            if search_term_lower in title_lower:
                 candidate['order'] += 1
-            candidate_list.append(candidate)
+            add_candidate(candidate)
 
         self.logger.debug(f'Found {len(candidate_list)} titles with last request')
         # --- Sort game list based on the score. High scored candidates go first ---
-        candidate_list.sort(key=lambda result: result['order'], reverse=True)
+        candidate_list.sort(key=itemgetter('order'), reverse=True)
 
+        self.cache_candidates[cache_key] = candidate_list
+        if len(self.cache_candidates) > SteamScraper.CANDIDATES_CACHE_SIZE:
+            self.cache_candidates.popitem(last=False)
         return candidate_list
 
     def _parse_metadata_title(self, game_dic):
@@ -318,21 +386,19 @@ class SteamScraper(Scraper):
         return title_str
 
     def _parse_metadata_year(self, online_data):
+        year_str = constants.DEFAULT_META_YEAR
         if 'release_date' in online_data and 'date' in online_data['release_date'] and \
                 online_data['release_date']['date'] is not None:
-            year_str = online_data['release_date']['date'][-4]
-        else:
-            year_str = constants.DEFAULT_META_YEAR
+            # Steam dates come in several formats ('3 Nov, 2017', 'Nov 2017', 'Coming soon').
+            year_match = _RE_YEAR.search(online_data['release_date']['date'])
+            if year_match:
+                year_str = year_match.group(0)
         return year_str
 
     def _parse_metadata_genres(self, online_data):
         if 'genres' not in online_data:
             return ''
-        
-        genres = [g['description'] for g in online_data['genres']]
-        if not genres:
-            return constants.DEFAULT_META_GENRE
-        return ', '.join(genres)
+        return ', '.join([g['description'] for g in online_data['genres']]) or constants.DEFAULT_META_GENRE
 
     def _parse_metadata_developer(self, online_data):
         if 'developers' not in online_data:
@@ -357,33 +423,12 @@ class SteamScraper(Scraper):
         return score
 
     def _parse_metadata_tags(self, online_data: dict) -> list:
-        tags = []
         if 'categories' not in online_data:
-            return tags
-
-        category_ids = [c['id'] for c in online_data['categories']]
-        if 1 in category_ids:
-            tags.append('multiplayer')
-        if 2 in category_ids:
-            tags.append('singleplayer')
-        if 9 in category_ids:
-            tags.append('co-op')
-        if 38 in category_ids:
-            tags.append('online-co-op')
-        if 49 in category_ids:
-            tags.append('pvp')
-        if 36 in category_ids:
-            tags.append('online-pvp')
-        if 24 in category_ids or 37 in category_ids or 39 in category_ids:
-            tags.append('splitscreen')
-        if 18 in category_ids:
-            tags.append('partial-controller-support')
-        if 28 in category_ids:
-            tags.append('controller-supported')
-        if 9 in category_ids:
-            tags.append('co-op')
-        
-        return tags
+            return []
+
+        category_ids = set(c['id'] for c in online_data['categories'])
+        return [tag for tag, tag_category_ids in SteamScraper.CATEGORY_TAGS
+                if not tag_category_ids.isdisjoint(category_ids)]
 
     # Steam URLs are safe for printing.
     # Clean URLs for safe logging.
@@ -393,47 +438,56 @@ class SteamScraper(Scraper):
 
         clean_url = url
         # apikey is followed by more arguments
-        clean_url = re.sub('apikey=[^&]*&', 'apikey=***&', clean_url)
+        clean_url = _RE_APIKEY_MID.sub('apikey=***&', clean_url)
         # apikey is at the end of the string
-        clean_url = re.sub('apikey=[^&]*$', 'apikey=***', clean_url)
+        clean_url = _RE_APIKEY_END.sub('apikey=***', clean_url)
         return clean_url
 
     def _clean_HTML_from_text(self, txt):
-        cleaned = re.sub('<[^<]+?>', '', txt)
+        cleaned = _RE_HTML_TAG.sub('', txt)
         return cleaned
 
     def _clean_url_slashes(self, url):
         return url.replace("\\", "")
 
+    # Waits only when the last API_CALLS_PER_WINDOW requests were all sent within the
+    # window, so requests that are already spread out (e.g. disk cache hits in between)
+    # are never delayed.
+    def _throttle_API_request(self):
+        if len(self.api_call_times) == self.api_call_times.maxlen:
+            wait_time = SteamScraper.API_WINDOW_SECONDS - (time.monotonic() - self.api_call_times[0])
+            if wait_time > 0:
+                self._wait_for_API_request(int(wait_time * 1000))
+        self.api_call_times.append(time.monotonic())
+
     # Retrieve URL and decode JSON object.
     #
-    # * When the URL is called too often, we apply a timeout
-    def _retrieve_URL_as_JSON(self, url, status_dic, retry=1):
-        if self.call_count > 4:
-            self._wait_for_API_request(1000)
-            self.call_count = 0
+    # * When the URL is called too often, we apply a timeout (see _throttle_API_request)
+    # * When Steam answers with 429 we back off and retry up to 4 times
+    def _retrieve_URL_as_JSON(self, url, status_dic):
+        for retry in range(1, 6):
+            self._throttle_API_request()
+            json_data, http_code = net.get_URL(url, self._clean_URL_for_log(url), content_type=net.ContentType.JSON)
+
+            if http_code != 429:
+                break
+
+            if retry > 4:
+                self.logger.error("Too many requests after 4 tries. Quiting")
+                self._handle_error(status_dic, (
+                    'Steam has received too many requests. '
+                    'Stop scraping for now and repeat at a later time.'
+                ))
+                return None
 
-        json_data, http_code = net.get_URL(url, self._clean_URL_for_log(url), content_type=net.ContentType.JSON)
-        self.call_count += 1
+            self.logger.warning(f"Steam Too many requests: {json_data}")
+            kodi.notify(f"Too many requests. Waiting {5*retry} seconds.")
+            self._wait_for_API_request(5000 * retry)
+            # Already waited long enough, no need for the throttle pause on the retry.
+            self.api_call_times.clear()
 
         # --- Check HTTP error codes ---
         if http_code != 200:
-
-            if http_code == 429:
-                if retry > 4:
-                    self.logger.error("Too many requests after 4 tries. Quiting")
-                    self._handle_error(status_dic, (
-                        'Steam has received too many requests. '
-                        'Stop scraping for now and repeat at a later time.'
-                    ))
-                    return None
-
-                self.logger.warning(f"Steam Too many requests: {json_data}")
-                kodi.notify(f"Too many requests. Waiting {5*retry} seconds.")
-                self._wait_for_API_request(5000 * retry)
-                retry += 1
-                return self._retrieve_URL_as_JSON(url, status_dic, retry)
-
             self.logger.error(f'Steam HTTP error code "{http_code}"')
             self._handle_error(status_dic, f'HTTP code {http_code}')
             return None
@@ -445,3 +499,8 @@ class SteamScraper(Scraper):
             return None
 
         return json_data
+
+
+# --- Plugin settings values ------------------------------------------------------------------
+SUPPORTED_METADATA_JOINED = '|'.join(SteamScraper.supported_metadata_list)
+SUPPORTED_ASSETS_JOINED = '|'.join(SteamScraper.supported_asset_list)
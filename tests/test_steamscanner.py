@@ -4,6 +4,7 @@ from unittest.mock import MagicMock, patch
 
 import json
 import logging
+import time
 
 from tests.fakes import FakeProgressDialog, random_string, FakeFile
 
@@ -65,5 +66,32 @@ class Test_SteamScanner(unittest.TestCase):
         self.assertIsNotNone(target.scanned_roms)
         assert actual == expected
 
+    @patch('akl.api.client_get_roms_in_collection')
+    @patch('akl.api.client_get_source_scanner_settings')
+    @patch('resources.lib.scanner.settings.getSettingAsInt', return_value=10)
+    @patch('resources.lib.scanner.net.get_URL') 
+    def test_when_steam_library_is_cached_it_will_not_be_retrieved_again(self, 
+            mock_urlopen:MagicMock, settings_mock:MagicMock, api_settings_mock:MagicMock, api_roms_mock:MagicMock):
+        # arrange
+        source_id = random_string(5)
+        cached_response = json.loads(read_file(self.TEST_ASSETS_DIR + "/steamresponse.json"))
+
+        api_settings_mock.return_value = { 'steamid': '09090909' }               
+        api_roms_mock.return_value = []
+
+        report_dir = FakeFile('//fake_reports/')
+        report_dir.setFakeContent(json.dumps({'timestamp': time.time(), 'response': cached_response}))
+        expected = len(cached_response['response']['games'])
+
+        # act
+        target = SteamScanner(report_dir, source_id, None, 0, FakeProgressDialog())
+        target.scan()
+        
+        actual = target.amount_of_scanned_roms()
+
+        # assert
+        mock_urlopen.assert_not_called()
+        assert actual == expected
+
 if __name__ == '__main__':    
     unittest.main()
@@ -114,4 +114,207 @@ class Test_steam_scraper(unittest.TestCase):
         self.assertTrue(actual) 
         logger.info(actual.get_data_dic()) 
         
-        self.assertTrue(actual.entity_data['assets'][constants.ASSET_SNAP_ID], 'No snap defined')      
\ No newline at end of file
+        self.assertTrue(actual.entity_data['assets'][constants.ASSET_SNAP_ID], 'No snap defined')      
+
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_parsing_tags_adds_each_tag_once(self, settings_file_mock):
+        # arrange
+        online_data = {
+            'categories': [{'id': 9}, {'id': 1}, {'id': 37}, {'id': 24}, {'id': 9}]
+        }
+        expected = ['multiplayer', 'co-op', 'splitscreen']
+        target = SteamScraper()
+
+        # act
+        actual = target._parse_metadata_tags(online_data)
+
+        # assert
+        self.assertEqual(expected, actual)
+
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_parsing_year_returns_the_full_year(self, settings_file_mock):
+        # arrange
+        target = SteamScraper()
+
+        # act
+        actual = target._parse_metadata_year({'release_date': {'coming_soon': False, 'date': '3 Nov, 2017'}})
+        actual_unknown = target._parse_metadata_year({'release_date': {'coming_soon': True, 'date': 'Coming soon'}})
+
+        # assert
+        self.assertEqual('2017', actual)
+        self.assertEqual(constants.DEFAULT_META_YEAR, actual_unknown)
+
+    @patch('resources.lib.scraper.net.get_URL', side_effect = mocked_steam)
+    @patch('resources.lib.scraper.SteamScraper._update_disk_cache')
+    @patch('resources.lib.scraper.SteamScraper._check_disk_cache', return_value=False)
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    @patch('resources.lib.scraper.settings.getSetting', autospec=True, return_value=random_string(12))
+    def test_metadata_disk_cache_stores_parsed_gamedata_and_asset_slice(self,
+        settings_mock, settings_file_mock, check_cache_mock, update_cache_mock: MagicMock, mock_get):
+        # arrange
+        target = SteamScraper()
+        target.candidate = {'id': '476600', 'display_name': 'Call of Duty®: WWII'}
+        target.cache_key = 'Call of Duty WWII'
+
+        # act
+        target.get_metadata({'status': True, 'dialog': None, 'msg': ''})
+
+        # assert
+        update_cache_mock.assert_called_once()
+        cache_type, cache_key, cached_data = update_cache_mock.call_args[0]
+        self.assertEqual(f'Call of Duty WWII_v{SteamScraper.METADATA_CACHE_VERSION}', cache_key)
+        self.assertEqual('Call of Duty®: WWII', cached_data['gamedata']['title'])
+        self.assertNotIn('<', cached_data['gamedata']['plot'])
+        self.assertEqual(set(SteamScraper.ASSET_SLICE_FIELDS), set(cached_data['asset_slice']))
+
+    @patch('resources.lib.scraper.SteamScraper._get_online_data')
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_banner_uses_the_header_image_from_appdetails(self, settings_file_mock, online_data_mock: MagicMock):
+        # arrange
+        online_data_mock.return_value = {
+            'gamedata': {},
+            'asset_slice': {'header_image': 'https:\\/\\/cdn.example.com\\/476600\\/header.jpg?t=1646764749'}
+        }
+        target = SteamScraper()
+        target.candidate = {'id': '476600'}
+
+        # act
+        actual = target.get_assets(constants.ASSET_BANNER_ID, {'status': True, 'dialog': None, 'msg': ''})
+
+        # assert
+        self.assertEqual(1, len(actual))
+        self.assertEqual('https://cdn.example.com/476600/header.jpg?t=1646764749', actual[0]['url'])
+
+    @patch('resources.lib.scraper.SteamScraper._get_online_data')
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_banner_without_header_image_returns_no_assets(self, settings_file_mock, online_data_mock: MagicMock):
+        # arrange
+        online_data_mock.return_value = {'gamedata': {}, 'asset_slice': {}}
+        target = SteamScraper()
+        target.candidate = {'id': '476600'}
+
+        # act
+        actual = target.get_assets(constants.ASSET_BANNER_ID, {'status': True, 'dialog': None, 'msg': ''})
+
+        # assert
+        self.assertEqual([], actual)
+
+    @patch('resources.lib.scraper.net.get_URL', side_effect = mocked_steam)
+    @patch('resources.lib.scraper.SteamScraper._retrieve_from_disk_cache')
+    @patch('resources.lib.scraper.SteamScraper._check_disk_cache', return_value=True)
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_metadata_is_read_from_the_disk_cache(self,
+        settings_file_mock, check_cache_mock, retrieve_cache_mock: MagicMock, mock_get: MagicMock):
+        # arrange
+        retrieve_cache_mock.return_value = {
+            'gamedata': {'title': 'Call of Duty®: WWII', 'year': '2017'},
+            'asset_slice': {}
+        }
+        target = SteamScraper()
+        target.candidate = {'id': '476600', 'display_name': 'Call of Duty®: WWII'}
+        target.cache_key = 'Call of Duty WWII'
+
+        # act
+        actual = target.get_metadata({'status': True, 'dialog': None, 'msg': ''})
+
+        # assert
+        self.assertEqual('Call of Duty®: WWII', actual['title'])
+        self.assertEqual('2017', actual['year'])
+        mock_get.assert_not_called()
+
+    @patch('resources.lib.scraper.net.get_URL', side_effect = mocked_steam)
+    @patch('resources.lib.scraper.SteamScraper._update_disk_cache')
+    @patch('resources.lib.scraper.SteamScraper._check_disk_cache', return_value=False)
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    @patch('resources.lib.scraper.settings.getSetting', autospec=True, return_value=random_string(12))
+    def test_metadata_and_assets_share_one_appdetails_request(self,
+        settings_mock, settings_file_mock, check_cache_mock, update_cache_mock, mock_get: MagicMock):
+        # arrange
+        status_dic = {'status': True, 'dialog': None, 'msg': ''}
+        target = SteamScraper()
+        target.candidate = {'id': '476600', 'display_name': 'Call of Duty®: WWII'}
+        target.cache_key = 'Call of Duty WWII'
+
+        # act
+        target.get_metadata(status_dic)
+        for asset_id in SteamScraper.supported_asset_list:
+            target.get_assets(asset_id, status_dic)
+
+        # assert
+        appdetails_calls = [c for c in mock_get.call_args_list if 'appdetails' in c[0][0]]
+        self.assertEqual(1, len(appdetails_calls))
+
+    @patch('resources.lib.scraper.net.get_URL', side_effect = mocked_steam)
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_search_terms_with_surrounding_whitespace_are_ranked_the_same(self, settings_file_mock, mock_get: MagicMock):
+        # arrange
+        status_dic = {'status': True, 'dialog': None, 'msg': ''}
+        target = SteamScraper()
+
+        # act
+        actual_padded = target._search_candidates('Call of Duty: WWII ', status_dic)
+        actual = target._search_candidates('Call of Duty: WWII', status_dic)
+
+        # assert
+        self.assertEqual('Call of Duty: WWII', actual_padded[0]['display_name'])
+        self.assertEqual(4, actual_padded[0]['order'])
+        self.assertEqual(actual_padded, actual)
+        self.assertEqual(1, mock_get.call_count)
+        self.assertTrue(mock_get.call_args[0][0].endswith('/Call+of+Duty%3A+WWII'))
+
+    @patch('resources.lib.scraper.time.monotonic', return_value=100.0)
+    @patch('resources.lib.scraper.SteamScraper._wait_for_API_request')
+    @patch('resources.lib.scraper.net.get_URL', return_value=({'success': True}, 200))
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_burst_of_requests_waits_only_when_the_window_is_full(self,
+        settings_file_mock, mock_get, wait_mock: MagicMock, monotonic_mock):
+        # arrange
+        status_dic = {'status': True, 'dialog': None, 'msg': ''}
+        target = SteamScraper()
+
+        # act
+        for _ in range(SteamScraper.API_CALLS_PER_WINDOW):
+            target._retrieve_URL_as_JSON('https://example.com', status_dic)
+        waits_before_full = wait_mock.call_count
+        target._retrieve_URL_as_JSON('https://example.com', status_dic)
+
+        # assert
+        self.assertEqual(0, waits_before_full)
+        wait_mock.assert_called_once_with(int(SteamScraper.API_WINDOW_SECONDS * 1000))
+
+    @patch('resources.lib.scraper.kodi.notify')
+    @patch('resources.lib.scraper.SteamScraper._wait_for_API_request')
+    @patch('resources.lib.scraper.net.get_URL', return_value=(None, 429))
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_too_many_requests_backs_off_and_gives_up_after_five_tries(self,
+        settings_file_mock, mock_get: MagicMock, wait_mock: MagicMock, notify_mock):
+        # arrange
+        status_dic = {'status': True, 'dialog': None, 'msg': ''}
+        target = SteamScraper()
+
+        # act
+        actual = target._retrieve_URL_as_JSON('https://example.com', status_dic)
+
+        # assert
+        self.assertIsNone(actual)
+        self.assertFalse(status_dic['status'])
+        self.assertEqual(5, mock_get.call_count)
+        self.assertEqual([5000, 10000, 15000, 20000], [c[0][0] for c in wait_mock.call_args_list])
+
+    @patch('resources.lib.scraper.kodi.notify')
+    @patch('resources.lib.scraper.SteamScraper._wait_for_API_request')
+    @patch('resources.lib.scraper.net.get_URL', side_effect=[(None, 429), ({'success': True}, 200)])
+    @patch('resources.lib.scraper.settings.getSettingAsFilePath', autospec=True, return_value=FakeFile("/test"))
+    def test_too_many_requests_returns_the_data_of_the_retry(self,
+        settings_file_mock, mock_get: MagicMock, wait_mock: MagicMock, notify_mock):
+        # arrange
+        status_dic = {'status': True, 'dialog': None, 'msg': ''}
+        target = SteamScraper()
+
+        # act
+        actual = target._retrieve_URL_as_JSON('https://example.com', status_dic)
+
+        # assert
+        self.assertEqual({'success': True}, actual)
+        self.assertTrue(status_dic['status'])
+        wait_mock.assert_called_once_with(5000)